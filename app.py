@@ -78,11 +78,10 @@ def is_setup_complete() -> bool:
     AND the essential fields (provider + telegram token) are present.
     This prevents partial configs from skipping onboarding.
     """
-    if not CONFIG_FILE.exists():
-        return False
     try:
-        with open(CONFIG_FILE) as f:
-            config = json.load(f)
+        config = _engine_config().read_stored_config()
+        if config is None:
+            return False
         if not config.get("setup_complete", False):
             return False
         # Must have at least a CLI and telegram token
@@ -93,12 +92,27 @@ def is_setup_complete() -> bool:
         return False
 
 
+def _engine_config():
+    """Import engine.config (config load/save helpers) from the bundled engine."""
+    if str(ENGINE_DIR.parent) not in sys.path:
+        sys.path.insert(0, str(ENGINE_DIR.parent))
+    import engine.config
+    return engine.config
+
+
+def _write_config(config: dict):
+    """Write config.json via engine.config.save_config.
+
+    Atomic, serialized with the engine thread's own saves, and keeps the
+    file's existing (private) permissions — it holds the bot token.
+    """
+    _engine_config().save_config(config)
+
+
 def load_config() -> dict:
     """Load config."""
-    if CONFIG_FILE.exists():
-        with open(CONFIG_FILE) as f:
-            return json.load(f)
-    return {}
+    config = _engine_config().read_stored_config()
+    return config.copy() if config is not None else {}
 
 
 _engine_thread = None
@@ -247,7 +261,7 @@ class OnboardingHandler(BaseHTTPRequestHandler):
     
     def _send_json(self, status: int, data: dict):
         """Send JSON response."""
-        body = json.dumps(data).encode()
+        body = json.dumps(data, separators=(",", ":")).encode()
         self.send_response(status)
         self.send_header('Content-Type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', '*')
@@ -306,9 +320,8 @@ class OnboardingHandler(BaseHTTPRequestHandler):
 
         # --- Config ---
         try:
-            if CONFIG_FILE.exists():
-                with open(CONFIG_FILE) as f:
-                    cfg = json.load(f)
+            cfg = _engine_config().read_stored_config()
+            if cfg is not None:
                 data["config"] = {
                     "name": cfg.get("name", ""),
                     "timezone": cfg.get("timezone", "UTC"),
@@ -594,8 +607,7 @@ class OnboardingHandler(BaseHTTPRequestHandler):
             config = json.loads(body)
             config["setup_complete"] = True
             
-            with open(CONFIG_FILE, "w") as f:
-                json.dump(config, f, indent=2)
+            _write_config(config)
             
             self._send_json(200, {"status": "ok"})
             
@@ -11,26 +11,26 @@ import asyncio
 import json
 import logging
 import os
-import subprocess
 import sys
 import tempfile
 import time
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-# Add engine dir to path
-sys.path.insert(0, str(Path(__file__).parent))
-sys.path.insert(0, str(Path(__file__).parent.parent))
+if __name__ == "__main__":
+    # Run as a script — make the engine package importable
+    sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from telegram import Update
-from telegram.ext import (
-    Application, CommandHandler, MessageHandler,
-    ContextTypes, filters
-)
-from telegram.constants import ChatAction
+# telegram is imported lazily (in _build_app / handlers) so importing this
+# module doesn't pay the python-telegram-bot import cost up front.
+if TYPE_CHECKING:
+    from telegram import Update
+    from telegram.ext import Application, ContextTypes
 
-from engine.config import load_config, save_config, CONFIG_DIR, IDENTITY_FILE, WORKSPACE
+from engine.config import (
+    load_config, save_config, write_json_atomic, CONFIG_DIR, IDENTITY_FILE, WORKSPACE,
+)
 from engine.cli_adapter import get_adapter, sync_identity_file, get_env, detect_available_clis
-from engine.updater import check_for_updates, perform_update, restart_bot
 
 logger = logging.getLogger("kiyomi.bot")
 
@@ -51,8 +51,7 @@ def _load_sessions() -> dict:
 
 def _save_sessions(sessions: dict):
     try:
-        with open(SESSIONS_FILE, "w") as f:
-            json.dump(sessions, f, indent=2)
+        write_json_atomic(SESSIONS_FILE, sessions)
     except (IOError, OSError) as e:
         logger.warning(f"Failed to save sessions: {e}")
 
@@ -60,6 +59,63 @@ def _save_sessions(sessions: dict):
 sessions = _load_sessions()
 
 
+# --- CLI execution ---
+# Every message spawns a CLI subprocess. Cap how many run at once so a burst
+# of messages queues up instead of forking hundreds of processes.
+_CLI_CONCURRENCY = max(2, (os.cpu_count() or 1) * 2)
+_cli_sem: asyncio.Semaphore | None = None
+
+
+def _get_cli_semaphore() -> asyncio.Semaphore:
+    """Get the CLI semaphore, creating it inside the running event loop."""
+    global _cli_sem
+    if _cli_sem is None:
+        _cli_sem = asyncio.Semaphore(_CLI_CONCURRENCY)
+    return _cli_sem
+
+
+# The CLI cwd (and upload temp files) is the shared WORKSPACE, and new files
+# there are sent back to whoever asked — only one message may use it at once.
+_workspace_lock: asyncio.Lock | None = None
+
+
+def _get_workspace_lock() -> asyncio.Lock:
+    """Get the workspace lock, creating it inside the running event loop."""
+    global _workspace_lock
+    if _workspace_lock is None:
+        _workspace_lock = asyncio.Lock()
+    return _workspace_lock
+
+
+async def _run_cli(cmd: list[str], timeout: float) -> tuple[str, str, int]:
+    """Run a CLI command without blocking the event loop.
+
+    Returns (stdout, stderr, returncode). Raises asyncio.TimeoutError
+    (after killing the process) if it runs longer than timeout seconds.
+    """
+    async with _get_cli_semaphore():
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=str(WORKSPACE),
+            env=get_env(),
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+        finally:
+            # Timed out or cancelled (e.g. workers stopped at shutdown) —
+            # never leave the CLI running on its own in the workspace
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+    return (
+        stdout.decode(errors="replace"),
+        stderr.decode(errors="replace"),
+        proc.returncode,
+    )
+
+
 # --- File detection ---
 def _find_new_files(workspace: Path, since: float) -> list[Path]:
     """Find files created in workspace since timestamp."""
@@ -69,7 +125,7 @@ def _find_new_files(workspace: Path, since: float) -> list[Path]:
         "sessions.json", "config.json", "cron.json", "reminders.json",
         "relationships.json", "habits.json", "kiyomi.lock",
     }
-    skip_ext = {".log", ".lock", ".pid"}
+    skip_ext = {".log", ".lock", ".pid", ".tmp"}
     for item in workspace.iterdir():
         if item.name.startswith(".") or item.name in skip:
             continue
@@ -181,6 +237,10 @@ async def cmd_identity(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def cmd_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Check for updates."""
+    # Imported here — the updater pulls in urllib/http.client/ssl, which
+    # nothing else on the message path needs.
+    from engine.updater import check_for_updates, perform_update, restart_bot
+
     await update.message.reply_text("Checking for updates...")
     try:
         info = await check_for_updates()
@@ -211,6 +271,36 @@ async def cmd_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Queue an incoming message for the CLI workers.
+
+    Returns as soon as the message is queued so PTB can keep processing
+    updates while the CLI runs.
+    """
+    await _enqueue(_process_message, update, context)
+
+
+async def _enqueue(handler, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Queue handler(update, context) to run on a worker in chat order."""
+    if _message_queue is None:
+        # Workers not started — fall back to handling it inline
+        await handler(update, context)
+        return
+    await _message_queue.put((handler, update, context))
+
+
+def _in_chat_order(handler):
+    """Wrap a command handler so it runs through the message queue.
+
+    Commands that touch the session (/reset, /cli) must not overtake a
+    message from the same chat that is still waiting on the CLI — the
+    finished message would save its session right back.
+    """
+    async def enqueue(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        await _enqueue(handler, update, context)
+    return enqueue
+
+
+async def _process_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle all text and media messages — the core loop."""
     config = load_config()
     chat_id = str(update.effective_chat.id)
@@ -251,120 +341,107 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Build the message text
     message_text = update.message.text or update.message.caption or ""
 
-    # Track all temp files for cleanup
-    temp_files = []
-
-    # Handle photos
-    image_path = None
-    if update.message.photo:
-        photo = update.message.photo[-1]  # Highest resolution
-        photo_file = await photo.get_file()
-        tmp = tempfile.NamedTemporaryFile(suffix=".jpg", delete=False, dir=str(WORKSPACE))
-        tmp.close()  # Close before download_to_drive writes to it
-        await photo_file.download_to_drive(tmp.name)
-        image_path = tmp.name
-        temp_files.append(tmp.name)
-        if not message_text:
-            message_text = "Describe this image in detail."
-
-    # Handle documents (PDFs, etc.)
-    if update.message.document:
-        doc = update.message.document
-        doc_file = await doc.get_file()
-        ext = Path(doc.file_name).suffix if doc.file_name else ".bin"
-        tmp = tempfile.NamedTemporaryFile(suffix=ext, delete=False, dir=str(WORKSPACE))
-        tmp.close()  # Close before download_to_drive writes to it
-        await doc_file.download_to_drive(tmp.name)
-        temp_files.append(tmp.name)
+    # Chats share one workspace: hold it from the upload downloads until new
+    # files are collected, so a chat never picks up another chat's files.
+    async with _get_workspace_lock():
+        # Track all temp files for cleanup
+        temp_files = []
+
+        # Handle photos
+        image_path = None
+        if update.message.photo:
+            photo = update.message.photo[-1]  # Highest resolution
+            photo_file = await photo.get_file()
+            tmp = tempfile.NamedTemporaryFile(suffix=".jpg", delete=False, dir=str(WORKSPACE))
+            tmp.close()  # Close before download_to_drive writes to it
+            await photo_file.download_to_drive(tmp.name)
+            image_path = tmp.name
+            temp_files.append(tmp.name)
+            if not message_text:
+                message_text = "Describe this image in detail."
+
+        # Handle documents (PDFs, etc.)
+        if update.message.document:
+            doc = update.message.document
+            doc_file = await doc.get_file()
+            ext = Path(doc.file_name).suffix if doc.file_name else ".bin"
+            tmp = tempfile.NamedTemporaryFile(suffix=ext, delete=False, dir=str(WORKSPACE))
+            tmp.close()  # Close before download_to_drive writes to it
+            await doc_file.download_to_drive(tmp.name)
+            temp_files.append(tmp.name)
+            if not message_text:
+                message_text = f"Analyze this file: {tmp.name}"
+            else:
+                message_text = f"{message_text}\n\nFile saved at: {tmp.name}"
+
+        # Handle voice messages
+        if update.message.voice:
+            voice = update.message.voice
+            voice_file = await voice.get_file()
+            tmp = tempfile.NamedTemporaryFile(suffix=".ogg", delete=False, dir=str(WORKSPACE))
+            tmp.close()  # Close before download_to_drive writes to it
+            await voice_file.download_to_drive(tmp.name)
+            temp_files.append(tmp.name)
+            message_text = f"Transcribe and respond to this voice message: {tmp.name}"
+
         if not message_text:
-            message_text = f"Analyze this file: {tmp.name}"
-        else:
-            message_text = f"{message_text}\n\nFile saved at: {tmp.name}"
-
-    # Handle voice messages
-    if update.message.voice:
-        voice = update.message.voice
-        voice_file = await voice.get_file()
-        tmp = tempfile.NamedTemporaryFile(suffix=".ogg", delete=False, dir=str(WORKSPACE))
-        tmp.close()  # Close before download_to_drive writes to it
-        await voice_file.download_to_drive(tmp.name)
-        temp_files.append(tmp.name)
-        message_text = f"Transcribe and respond to this voice message: {tmp.name}"
-
-    if not message_text:
-        return
+            return
 
-    # Show typing indicator
-    await update.message.chat.send_action(ChatAction.TYPING)
+        # Show typing indicator
+        from telegram.constants import ChatAction
+        await update.message.chat.send_action(ChatAction.TYPING)
 
-    # Sync identity file before calling CLI
-    sync_identity_file(cli_name, WORKSPACE)
+        # Sync identity file before calling CLI
+        sync_identity_file(cli_name, WORKSPACE)
 
-    # Build and run CLI command
-    session_id = sessions.get(chat_id)
-    model = config.get("model") or None
-    timeout = config.get("cli_timeout", 120)
+        # Build and run CLI command
+        session_id = sessions.get(chat_id)
+        model = config.get("model") or None
+        timeout = config.get("cli_timeout", 120)
 
-    try:
         cmd = adapter.build_command(
             message=message_text,
             session_id=session_id,
             model=model,
             image_path=image_path,
         )
-    except FileNotFoundError as e:
-        # Clean up temp files before returning
-        for tmp_path in temp_files:
-            try:
-                os.unlink(tmp_path)
-            except OSError:
-                pass
-        await update.message.reply_text(
-            f"The {cli_name} CLI isn't installed. "
-            f"Use /cli to switch to a different AI provider, or reinstall it."
-        )
-        return
 
-    logger.info(f"[{cli_name}] Running: {' '.join(cmd[:4])}...")
-    before = time.time()
+        logger.info(f"[{cli_name}] Running: {' '.join(cmd[:4])}...")
+        before = time.time()
 
-    try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=timeout,
-            cwd=str(WORKSPACE),
-            env=get_env(),
-        )
-        elapsed = time.time() - before
-        logger.info(f"[{cli_name}] Completed in {elapsed:.1f}s (rc={result.returncode})")
+        try:
+            stdout, stderr, returncode = await _run_cli(cmd, timeout)
+            elapsed = time.time() - before
+            logger.info(f"[{cli_name}] Completed in {elapsed:.1f}s (rc={returncode})")
 
-        response_text, new_session_id = adapter.parse_response(
-            result.stdout, result.stderr, result.returncode
-        )
+            response_text, new_session_id = adapter.parse_response(stdout, stderr, returncode)
 
-        # Update session
-        if new_session_id:
-            sessions[chat_id] = new_session_id
-            _save_sessions(sessions)
+            # Update session — resumed sessions usually keep their id, so only
+            # write when it changed, and fsync off the event loop (on a copy,
+            # since other chats keep mutating the dict meanwhile).
+            if new_session_id and new_session_id != sessions.get(chat_id):
+                sessions[chat_id] = new_session_id
+                await asyncio.to_thread(_save_sessions, dict(sessions))
 
-    except subprocess.TimeoutExpired:
-        response_text = f"The AI took too long to respond (>{timeout}s timeout). Try a shorter message or /reset."
-    except Exception as e:
-        logger.error(f"CLI error: {e}", exc_info=True)
-        response_text = (
-            f"Something went wrong while talking to {cli_name}. "
-            f"Try again, or use /reset to start a fresh conversation. "
-            f"If this keeps happening, try /cli to switch AI providers."
-        )
+        except asyncio.TimeoutError:
+            response_text = f"The AI took too long to respond (>{timeout}s timeout). Try a shorter message or /reset."
+        except Exception as e:
+            logger.error(f"CLI error: {e}", exc_info=True)
+            response_text = (
+                f"Something went wrong while talking to {cli_name}. "
+                f"Try again, or use /reset to start a fresh conversation. "
+                f"If this keeps happening, try /cli to switch AI providers."
+            )
 
-    # Clean up all temp files (photos, documents, voice)
-    for tmp_path in temp_files:
-        try:
-            os.unlink(tmp_path)
-        except OSError:
-            pass
+        # Clean up all temp files (photos, documents, voice)
+        for tmp_path in temp_files:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+        # Check for new files in workspace
+        new_files = _find_new_files(WORKSPACE, before)
 
     # Send response (split if too long for Telegram)
     if not response_text:
@@ -378,8 +455,6 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # Markdown parse failed — send as plain text
             await update.message.reply_text(chunk)
 
-    # Check for new files in workspace
-    new_files = _find_new_files(WORKSPACE, before)
     for f in new_files[:5]:  # Max 5 files
         try:
             if f.stat().st_size < 10_000_000:  # <10MB
@@ -411,22 +486,80 @@ def _split_message(text: str, max_len: int = 4000) -> list[str]:
     return chunks
 
 
+# --- Message Workers ---
+# handle_message (and /reset, /cli) only enqueue; a pool of workers runs the
+# CLI and replies. Messages from the same chat are processed in order
+# (per-chat lock) so a conversation's CLI session is never resumed by two
+# calls at once, and a /reset never lands before an earlier message finishes.
+# The CLI run itself is also serialized across chats (_workspace_lock), since
+# every chat shares the workspace; replies and downloads still overlap.
+_QUEUE_MAXSIZE = 100
+_message_queue: asyncio.Queue | None = None
+_workers: list[asyncio.Task] = []
+_chat_locks: dict[str, asyncio.Lock] = {}
+
+
+async def _cli_worker(queue: asyncio.Queue):
+    """Pull queued messages and commands and run them until cancelled."""
+    while True:
+        handler, update, context = await queue.get()
+        try:
+            chat_id = str(update.effective_chat.id)
+            lock = _chat_locks.setdefault(chat_id, asyncio.Lock())
+            async with lock:
+                await handler(update, context)
+        except Exception as e:
+            logger.error(f"Message worker error: {e}", exc_info=True)
+        finally:
+            queue.task_done()
+
+
+async def _start_workers(app=None):
+    """Create the message queue and start the worker pool."""
+    global _message_queue
+    if _workers:
+        return
+    _message_queue = asyncio.Queue(maxsize=_QUEUE_MAXSIZE)
+    for i in range(_CLI_CONCURRENCY):
+        _workers.append(asyncio.create_task(_cli_worker(_message_queue), name=f"kiyomi-worker-{i}"))
+    logger.info(f"Started {_CLI_CONCURRENCY} message workers")
+
+
+async def _stop_workers(app=None):
+    """Cancel the worker pool and drop any queued messages."""
+    global _message_queue
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    _chat_locks.clear()
+    _message_queue = None
+
+
 # --- App Builder ---
 
 def _build_app() -> Application | None:
     """Build the Telegram Application."""
+    from telegram.ext import Application, CommandHandler, MessageHandler, filters
+
     config = load_config()
     token = config.get("telegram_token", "")
     if not token:
         logger.error("No Telegram token configured")
         return None
 
-    app = Application.builder().token(token).build()
+    app = (
+        Application.builder()
+        .token(token)
+        .post_init(_start_workers)
+        .post_shutdown(_stop_workers)
+        .build()
+    )
 
     # Commands
     app.add_handler(CommandHandler("start", cmd_start))
-    app.add_handler(CommandHandler("reset", cmd_reset))
-    app.add_handler(CommandHandler("cli", cmd_cli))
+    app.add_handler(CommandHandler("reset", _in_chat_order(cmd_reset)))
+    app.add_handler(CommandHandler("cli", _in_chat_order(cmd_cli)))
     app.add_handler(CommandHandler("identity", cmd_identity))
     app.add_handler(CommandHandler("update", cmd_update))
 
@@ -484,7 +617,7 @@ def main_threaded():
 
     Used when running inside the PyInstaller menu bar app.
     """
-    global _stop_event, _engine_loop
+    global _stop_event, _engine_loop, _cli_sem, _workspace_lock
 
     # Create event loop FIRST — Python 3.9 requires this before any
     # asyncio objects (like Queue) can be created in a thread.
@@ -505,6 +638,8 @@ def main_threaded():
         global _stop_event
         _stop_event = asyncio.Event()
         await app.initialize()
+        # post_init only fires under run_polling — start workers explicitly
+        await _start_workers(app)
         await app.start()
         await app.updater.start_polling(drop_pending_updates=True)
         logger.info("Kiyomi is running! Waiting for messages...")
@@ -514,6 +649,7 @@ def main_threaded():
             logger.info("Shutting down Telegram polling...")
             await app.updater.stop()
             await app.stop()
+            await _stop_workers(app)
             await app.shutdown()
 
     try:
@@ -522,6 +658,8 @@ def main_threaded():
         _engine_loop.close()
         _engine_loop = None
         _stop_event = None
+        _cli_sem = None
+        _workspace_lock = None
 
 
 if __name__ == "__main__":
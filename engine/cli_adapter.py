@@ -5,6 +5,7 @@ Each adapter knows how to build commands and parse responses.
 """
 from __future__ import annotations
 
+import functools
 import json
 import logging
 import os
@@ -13,6 +14,8 @@ from abc import ABC, abstractmethod
 from pathlib import Path
 from typing import Optional
 
+from engine.config import json_loads
+
 logger = logging.getLogger("kiyomi.cli_adapter")
 
 # Identity file names per CLI
@@ -23,26 +26,48 @@ IDENTITY_FILES = {
 }
 
 
-def _expanded_path() -> str:
-    """Get PATH with common install locations for launchd compatibility."""
+@functools.lru_cache(maxsize=4)
+def _build_expanded_path(path: str, home: str) -> str:
+    """Prepend common install locations to path (memoized per PATH/HOME)."""
     extra = [
         "/opt/homebrew/bin",
         "/usr/local/bin",
-        str(Path.home() / ".local" / "bin"),
-        str(Path.home() / ".npm-global" / "bin"),
-        str(Path.home() / ".cargo" / "bin"),
-        str(Path.home() / ".nvm" / "current" / "bin"),
+        str(Path(home) / ".local" / "bin"),
+        str(Path(home) / ".npm-global" / "bin"),
+        str(Path(home) / ".cargo" / "bin"),
+        str(Path(home) / ".nvm" / "current" / "bin"),
     ]
-    path = os.environ.get("PATH", "")
     for p in extra:
         if p not in path:
             path = f"{p}:{path}"
     return path
 
 
+def _expanded_path() -> str:
+    """Get PATH with common install locations for launchd compatibility."""
+    return _build_expanded_path(os.environ.get("PATH", ""), str(Path.home()))
+
+
+# {(name, PATH): binary} — only hits are cached, so a CLI installed while
+# Kiyomi is running is still found on the next lookup.
+_which_cache: dict[tuple[str, str], str] = {}
+
+
 def _which(name: str) -> Optional[str]:
-    """Find a CLI binary on expanded PATH."""
-    return shutil.which(name, path=_expanded_path())
+    """Find a CLI binary on expanded PATH.
+
+    Hits are cached per PATH value and re-checked with os.access on each
+    call, so a binary that was removed or reinstalled is looked up again.
+    """
+    path = _expanded_path()
+    found = _which_cache.get((name, path))
+    if found is not None and os.access(found, os.X_OK):
+        return found
+    _which_cache.pop((name, path), None)
+    found = shutil.which(name, path=path)
+    if found:
+        _which_cache[(name, path)] = found
+    return found
 
 
 def get_env() -> dict:
@@ -54,11 +79,46 @@ def get_env() -> dict:
     return env
 
 
+def _jsonl_events(stdout: str, marker: str, reverse: bool = False):
+    """Yield parsed JSONL lines that contain marker.
+
+    Only lines containing the marker substring are decoded, scanning
+    forward from the start (or backward from the end if reverse=True).
+    """
+    pos = len(stdout) if reverse else 0
+    while True:
+        hit = stdout.rfind(marker, 0, pos) if reverse else stdout.find(marker, pos)
+        if hit == -1:
+            return
+        start = stdout.rfind("\n", 0, hit) + 1
+        stop = stdout.find("\n", hit)
+        if stop == -1:
+            stop = len(stdout)
+        pos = start if reverse else stop
+        try:
+            data = json_loads(stdout[start:stop])
+        except json.JSONDecodeError:
+            continue
+        if isinstance(data, dict):
+            yield data
+
+
 class CLIAdapter(ABC):
     """Base adapter for calling an AI CLI."""
 
     name: str = ""
     identity_file: str = ""
+    install_hint: str = ""
+
+    # Flags appended to every invocation — fixed per adapter, so built once
+    _INVARIANT_ARGS: tuple = ()
+
+    def __init__(self):
+        self._binary = self.get_binary()
+        if not self._binary:
+            raise FileNotFoundError(
+                f"{self.name.title()} CLI not found. Install with: {self.install_hint}"
+            )
 
     @abstractmethod
     def build_command(
@@ -87,17 +147,15 @@ class ClaudeAdapter(CLIAdapter):
 
     name = "claude"
     identity_file = "CLAUDE.md"
+    install_hint = "npm install -g @anthropic-ai/claude-code"
+    _INVARIANT_ARGS = ("--output-format", "json", "--dangerously-skip-permissions")
 
     def build_command(self, message, session_id=None, model=None, cwd=None, image_path=None):
-        binary = self.get_binary()
-        if not binary:
-            raise FileNotFoundError("Claude CLI not found. Install with: npm install -g @anthropic-ai/claude-code")
-
         # If an image was provided, include the path in the prompt for Claude to read
         if image_path:
             message = f"{message}\n\nImage file: {image_path}"
 
-        cmd = [binary, "-p", message, "--output-format", "json", "--dangerously-skip-permissions"]
+        cmd = [self._binary, "-p", message, *self._INVARIANT_ARGS]
 
         if session_id:
             cmd.extend(["--resume", session_id])
@@ -107,7 +165,7 @@ class ClaudeAdapter(CLIAdapter):
         return cmd
 
     def parse_response(self, stdout, stderr, returncode):
-        if returncode != 0 and not stdout.strip():
+        if returncode != 0 and (not stdout or stdout.isspace()):
             logger.error(f"Claude CLI error (rc={returncode}): {stderr}")
             # Show user-friendly message, log raw error
             if "auth" in (stderr or "").lower() or "login" in (stderr or "").lower():
@@ -116,7 +174,7 @@ class ClaudeAdapter(CLIAdapter):
 
         # Claude outputs JSON with result and session_id
         try:
-            data = json.loads(stdout)
+            data = json_loads(stdout)
             text = data.get("result", "")
             sid = data.get("session_id")
             return text, sid
@@ -130,18 +188,14 @@ class CodexAdapter(CLIAdapter):
 
     name = "codex"
     identity_file = "AGENTS.md"
+    install_hint = "npm install -g @openai/codex"
+    _INVARIANT_ARGS = ("--json", "--dangerously-bypass-approvals-and-sandbox", "--skip-git-repo-check")
 
     def build_command(self, message, session_id=None, model=None, cwd=None, image_path=None):
-        binary = self.get_binary()
-        if not binary:
-            raise FileNotFoundError("Codex CLI not found. Install with: npm install -g @openai/codex")
-
         if session_id:
-            cmd = [binary, "exec", "resume", session_id, message]
+            cmd = [self._binary, "exec", "resume", session_id, message, *self._INVARIANT_ARGS]
         else:
-            cmd = [binary, "exec", message]
-
-        cmd.extend(["--json", "--dangerously-bypass-approvals-and-sandbox", "--skip-git-repo-check"])
+            cmd = [self._binary, "exec", message, *self._INVARIANT_ARGS]
 
         if model:
             cmd.extend(["-m", model])
@@ -151,38 +205,34 @@ class CodexAdapter(CLIAdapter):
         return cmd
 
     def parse_response(self, stdout, stderr, returncode):
-        if returncode != 0 and not stdout.strip():
+        if returncode != 0 and (not stdout or stdout.isspace()):
             logger.error(f"Codex CLI error (rc={returncode}): {stderr}")
             if "auth" in (stderr or "").lower() or "login" in (stderr or "").lower():
                 return "Codex needs to be re-authenticated. Run `codex login` in your terminal.", None
             return "Codex had trouble responding. Try again or use /reset to start fresh.", None
 
-        # Codex outputs JSONL — find last agent_message and thread_id
+        # Codex outputs JSONL — only two events matter: the last thread.started
+        # and the last agent_message. Find them by substring, scanning from the
+        # end, and parse just those lines instead of every event in the stream.
         text = ""
         session_id = None
 
-        for line in stdout.strip().splitlines():
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                data = json.loads(line)
-            except json.JSONDecodeError:
-                continue
-
-            # Look for thread ID
-            event_type = data.get("type", "")
-            if event_type == "thread.started":
+        for data in _jsonl_events(stdout, "thread.started", reverse=True):
+            if data.get("type") == "thread.started":
                 session_id = data.get("thread_id")
+                break
 
-            # Look for the last agent message
-            if event_type == "item.completed":
-                item = data.get("item", {})
-                if item.get("type") == "agent_message":
-                    # Extract text from content array
-                    for block in item.get("content", []):
-                        if block.get("type") == "output_text":
-                            text = block.get("text", "")
+        for data in _jsonl_events(stdout, "item.completed", reverse=True):
+            if data.get("type") != "item.completed":
+                continue
+            item = data.get("item", {})
+            if item.get("type") != "agent_message":
+                continue
+            # Extract text from content array (last output_text block wins)
+            blocks = [b for b in item.get("content", []) if b.get("type") == "output_text"]
+            if blocks:
+                text = blocks[-1].get("text", "")
+                break
 
         if not text:
             # Fallback: return raw stdout
@@ -196,17 +246,15 @@ class GeminiAdapter(CLIAdapter):
 
     name = "gemini"
     identity_file = "GEMINI.md"
+    install_hint = "npm install -g @google/gemini-cli"
+    _INVARIANT_ARGS = ("-o", "json", "-y")
 
     def build_command(self, message, session_id=None, model=None, cwd=None, image_path=None):
-        binary = self.get_binary()
-        if not binary:
-            raise FileNotFoundError("Gemini CLI not found. Install with: npm install -g @google/gemini-cli")
-
         # If an image was provided, include the path in the prompt for Gemini to read
         if image_path:
             message = f"{message}\n\nImage file: {image_path}"
 
-        cmd = [binary, "-p", message, "-o", "json", "-y"]
+        cmd = [self._binary, "-p", message, *self._INVARIANT_ARGS]
 
         if session_id:
             cmd.extend(["--resume", session_id])
@@ -216,14 +264,14 @@ class GeminiAdapter(CLIAdapter):
         return cmd
 
     def parse_response(self, stdout, stderr, returncode):
-        if returncode != 0 and not stdout.strip():
+        if returncode != 0 and (not stdout or stdout.isspace()):
             logger.error(f"Gemini CLI error (rc={returncode}): {stderr}")
             if "auth" in (stderr or "").lower() or "login" in (stderr or "").lower():
                 return "Gemini needs to be re-authenticated. Run `gemini` in your terminal to log in again.", None
             return "Gemini had trouble responding. Try again or use /reset to start fresh.", None
 
         try:
-            data = json.loads(stdout)
+            data = json_loads(stdout)
             text = data.get("response", "")
             sid = data.get("session_id")
             return text, sid
@@ -240,7 +288,11 @@ _ADAPTERS = {
 
 
 def get_adapter(cli_name: str) -> CLIAdapter:
-    """Get the adapter for a given CLI name."""
+    """Get the adapter for a given CLI name.
+
+    Raises ValueError for unknown names and FileNotFoundError if the
+    CLI binary isn't installed.
+    """
     cls = _ADAPTERS.get(cli_name)
     if not cls:
         raise ValueError(f"Unknown CLI: {cli_name}. Available: {list(_ADAPTERS.keys())}")
@@ -264,7 +316,9 @@ def sync_identity_file(cli_name: str, workspace: Path):
     This copies it to CLAUDE.md, AGENTS.md, or GEMINI.md as needed.
     """
     source = workspace / "identity.md"
-    if not source.exists():
+    try:
+        src_st = source.stat()
+    except FileNotFoundError:
         return
 
     target_name = IDENTITY_FILES.get(cli_name)
@@ -272,6 +326,15 @@ def sync_identity_file(cli_name: str, workspace: Path):
         return
 
     target = workspace / target_name
-    # Always overwrite — identity.md is source of truth
+    # copy2 preserves mtime, so a target with the same size and mtime is
+    # already in sync. Any edit to either file changes its mtime.
+    try:
+        tgt_st = target.stat()
+        if tgt_st.st_size == src_st.st_size and tgt_st.st_mtime_ns == src_st.st_mtime_ns:
+            return
+    except FileNotFoundError:
+        pass
+
+    # Overwrite — identity.md is source of truth
     shutil.copy2(str(source), str(target))
     logger.debug(f"Synced identity.md → {target_name}")
@@ -303,19 +303,19 @@ async def launch_cli_auth(provider: str, force: bool = False) -> dict:
             stdout, stderr = await asyncio.wait_for(
                 proc.communicate(), timeout=180
             )
-            output = stdout.decode(errors="replace")
-            errors = stderr.decode(errors="replace")
-
             # Verify auth completed
             post_auth = check_cli_auth(provider)
             if post_auth["authenticated"]:
                 result["detail"] = f"Authenticated successfully: {post_auth['detail']}"
             else:
+                # Only the first 200 bytes are shown — don't decode the rest
+                output = stdout[:200].decode(errors="replace")
+                errors = stderr[:200].decode(errors="replace")
                 result["detail"] = (
                     f"Auth flow completed but credentials not detected. "
-                    f"stdout: {output[:200]}, stderr: {errors[:200]}"
+                    f"stdout: {output}, stderr: {errors}"
                 )
-                logger.warning(f"{provider} auth flow completed but no creds: {errors[:200]}")
+                logger.warning(f"{provider} auth flow completed but no creds: {errors}")
 
         except asyncio.TimeoutError:
             # User may still be in the browser — check if auth landed
@@ -433,7 +433,7 @@ async def _install_node_via_homebrew() -> dict:
             logger.info("Node.js installed via Homebrew")
             return {"success": True}
         else:
-            return {"success": False, "error": stderr.decode()[:500]}
+            return {"success": False, "error": stderr[:500].decode(errors="replace")}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
@@ -499,7 +499,7 @@ async def install_cli(provider: str) -> dict:
             logger.info(f"{provider} CLI installed successfully")
             return {"success": True, "steps": steps, "error": None}
         else:
-            err = stderr.decode()[:500]
+            err = stderr[:500].decode(errors="replace")
             logger.error(f"npm install {package} failed: {err}")
             return {"success": False, "error": f"npm install failed: {err}", "steps": steps}
 
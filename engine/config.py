@@ -4,7 +4,17 @@ All config lives in ~/.kiyomi/config.json
 """
 import json
 import logging
+import os
+import stat
+import tempfile
+import threading
 from pathlib import Path
+from typing import Optional
+
+try:
+    import orjson
+except ImportError:  # optional speedup — stdlib json works the same
+    orjson = None
 
 CONFIG_DIR = Path.home() / ".kiyomi"
 CONFIG_FILE = CONFIG_DIR / "config.json"
@@ -26,27 +36,121 @@ DEFAULT_CONFIG = {
 }
 
 
+def json_loads(data):
+    """Parse JSON from str or bytes (orjson when installed, else stdlib).
+
+    Errors are json.JSONDecodeError either way — orjson's subclasses it.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps(data, indent: bool = False) -> bytes:
+    """Serialize data to UTF-8 JSON bytes: compact, or indented by 2."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if indent else 0)
+    if indent:
+        return json.dumps(data, indent=2).encode("utf-8")
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+_dirs_ready = False
+
+
 def ensure_dirs():
-    """Create all required directories."""
+    """Create all required directories (once per process)."""
+    global _dirs_ready
+    if _dirs_ready:
+        return
     for d in [CONFIG_DIR, LOGS_DIR]:
         d.mkdir(parents=True, exist_ok=True)
+    _dirs_ready = True
+
+
+# The engine thread and app.py's onboarding server share one process and
+# both write config.json; serialize the renames so writes land in order.
+_write_lock = threading.Lock()
+
+
+def write_json_atomic(path: Path, data, mode: int = 0o600):
+    """Write JSON to path atomically (temp file + rename).
+
+    The payload is serialized up front, written to a unique temp file next
+    to path and fsynced before the rename, so a crash mid-write leaves the
+    previous file intact instead of a truncated one. Safe to call from
+    several threads at once.
+
+    An existing file keeps its permissions; mode only applies when path is
+    created (private by default — config.json holds the bot token).
+    """
+    payload = memoryview(json_dumps(data, indent=True))
+    with _write_lock:
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            pass
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+        try:
+            try:
+                os.fchmod(fd, mode)
+                while payload:
+                    written = os.write(fd, payload)
+                    payload = payload[written:]
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+
+# (mtime_ns, size, stored) from the last successful read. load_config() is
+# called for every message and cron run (and app.py polls is_setup_complete)
+# but config.json rarely changes.
+_config_cache = None
+
+
+def read_stored_config() -> Optional[dict]:
+    """Return config.json as stored (no defaults merged), or None if missing.
+
+    The parsed dict is cached by (mtime_ns, size) and shared between
+    calls — copy it before modifying. Raises json.JSONDecodeError or
+    OSError if the file exists but can't be read.
+    """
+    global _config_cache
+    try:
+        st = CONFIG_FILE.stat()
+    except OSError:
+        return None
+    if _config_cache and _config_cache[:2] == (st.st_mtime_ns, st.st_size):
+        return _config_cache[2]
+    with open(CONFIG_FILE) as f:
+        stored = json.load(f)
+    _config_cache = (st.st_mtime_ns, st.st_size, stored)
+    return stored
 
 
 def load_config() -> dict:
     """Load config from ~/.kiyomi/config.json."""
     ensure_dirs()
-    if CONFIG_FILE.exists():
-        try:
-            with open(CONFIG_FILE) as f:
-                stored = json.load(f)
-                return {**DEFAULT_CONFIG, **stored}
-        except (json.JSONDecodeError, IOError) as e:
-            logging.getLogger(__name__).error(f"Failed to load config.json: {e}")
-    return DEFAULT_CONFIG.copy()
+    try:
+        stored = read_stored_config()
+    except (json.JSONDecodeError, IOError) as e:
+        logging.getLogger(__name__).error(f"Failed to load config.json: {e}")
+        return DEFAULT_CONFIG.copy()
+    if stored is None:
+        return DEFAULT_CONFIG.copy()
+    return {**DEFAULT_CONFIG, **stored}
 
 
 def save_config(config: dict):
     """Save config to ~/.kiyomi/config.json."""
+    global _config_cache
     ensure_dirs()
-    with open(CONFIG_FILE, "w") as f:
-        json.dump(config, f, indent=2)
+    write_json_atomic(CONFIG_FILE, config)
+    _config_cache = None
@@ -12,40 +12,71 @@ from datetime import datetime, timezone
 from pathlib import Path
 from zoneinfo import ZoneInfo
 
-from engine.config import CONFIG_DIR, WORKSPACE, load_config
+from engine.config import CONFIG_DIR, WORKSPACE, load_config, write_json_atomic
 from engine.cli_adapter import get_adapter, sync_identity_file, get_env
 
 logger = logging.getLogger("kiyomi.cron")
 CRON_FILE = CONFIG_DIR / "cron.json"
 
 
+# (mtime_ns, size, crons) from the last successful read. tick() runs every
+# minute but cron.json rarely changes, so only re-parse when it does.
+_cron_cache: tuple[int, int, list[dict]] | None = None
+
+
 def load_crons() -> list[dict]:
-    """Load cron jobs from cron.json."""
-    if CRON_FILE.exists():
-        try:
-            with open(CRON_FILE) as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            pass
-    return []
+    """Load cron jobs from cron.json.
+
+    The parsed list is cached and shared between calls — don't mutate it
+    in place; build a new list and pass it to save_crons().
+    """
+    global _cron_cache
+    try:
+        st = CRON_FILE.stat()
+    except OSError:
+        return []
+    if _cron_cache and _cron_cache[:2] == (st.st_mtime_ns, st.st_size):
+        return _cron_cache[2]
+    try:
+        with open(CRON_FILE) as f:
+            crons = json.load(f)
+    except (json.JSONDecodeError, IOError):
+        return []
+    for cron in crons:
+        _prepare(cron)
+    _cron_cache = (st.st_mtime_ns, st.st_size, crons)
+    return crons
 
 
 def save_crons(crons: list[dict]):
-    """Save cron jobs."""
-    with open(CRON_FILE, "w") as f:
-        json.dump(crons, f, indent=2)
+    """Save cron jobs (atomically, so a reader never sees a partial file)."""
+    global _cron_cache
+    stored = [{k: v for k, v in cron.items() if not k.startswith("_")} for cron in crons]
+    write_json_atomic(CRON_FILE, stored)
+    _cron_cache = None
+
 
+# Indexed by datetime.weekday(); matches the "days" names in cron.json.
+_DAY_NAMES = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
 
-def should_run(cron: dict, now: datetime) -> bool:
-    """Check if a cron job should run at this time.
+
+def _prepare(cron: dict):
+    """Precompute a cron's schedule so should_run() is just three compares.
 
     Simple format: {"hour": 9, "minute": 0, "days": ["mon","tue","wed","thu","fri"]}
+    The derived "_" keys are dropped again by save_crons().
     """
-    day_name = now.strftime("%a").lower()[:3]
-    days = cron.get("days", ["mon", "tue", "wed", "thu", "fri", "sat", "sun"])
-    if day_name not in days:
-        return False
-    return now.hour == cron.get("hour", 9) and now.minute == cron.get("minute", 0)
+    cron["_days"] = frozenset(cron.get("days", _DAY_NAMES))
+    cron["_hour"] = cron.get("hour", 9)
+    cron["_minute"] = cron.get("minute", 0)
+
+
+def should_run(cron: dict, day_name: str, hour: int, minute: int) -> bool:
+    """Check if a cron job (as returned by load_crons) should run at this time."""
+    return minute == cron["_minute"] and hour == cron["_hour"] and day_name in cron["_days"]
+
+
+_WORKSPACE_DIR = str(WORKSPACE)
 
 
 def run_cron(cron: dict):
@@ -55,7 +86,11 @@ def run_cron(cron: dict):
     if not cli_name:
         return
 
-    adapter = get_adapter(cli_name)
+    try:
+        adapter = get_adapter(cli_name)
+    except (ValueError, FileNotFoundError) as e:
+        logger.error(f"Cron '{cron.get('name', '?')}' skipped: {e}")
+        return None
     sync_identity_file(cli_name, WORKSPACE)
 
     prompt = cron.get("prompt", "")
@@ -66,7 +101,7 @@ def run_cron(cron: dict):
         cmd = adapter.build_command(message=prompt)
         result = subprocess.run(
             cmd, capture_output=True, text=True,
-            timeout=120, cwd=str(WORKSPACE), env=get_env(),
+            timeout=120, cwd=_WORKSPACE_DIR, env=get_env(),
         )
         text, _ = adapter.parse_response(result.stdout, result.stderr, result.returncode)
         logger.info(f"Cron '{cron.get('name', '?')}' ran: {text[:100]}")
@@ -76,19 +111,24 @@ def run_cron(cron: dict):
         return None
 
 
-def tick():
-    """Check and run any due cron jobs. Call this once per minute.
-
-    Uses the user's configured timezone from config.json (default: America/New_York).
-    """
+def _get_timezone():
+    """Get the user's configured timezone (default: America/New_York)."""
     config = load_config()
     tz_name = config.get("timezone", "America/New_York")
     try:
-        tz = ZoneInfo(tz_name)
+        return ZoneInfo(tz_name)
     except (KeyError, Exception):
         logger.warning(f"Invalid timezone '{tz_name}', falling back to UTC")
-        tz = timezone.utc
-    now = datetime.now(tz)
+        return timezone.utc
+
+
+def tick():
+    """Check and run any due cron jobs. Call this once per minute.
+
+    Uses the user's configured timezone from config.json (default: America/New_York).
+    """
+    now = datetime.now(_get_timezone())
+    day_name = _DAY_NAMES[now.weekday()]
     for cron in load_crons():
-        if should_run(cron, now):
+        if should_run(cron, day_name, now.hour, now.minute):
             run_cron(cron)
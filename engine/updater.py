@@ -4,7 +4,8 @@ Checks GitHub Releases for new versions and auto-updates.
 No git dependency — works on any Mac.
 """
 import asyncio
-import json
+import functools
+import hashlib
 import logging
 import os
 import re
@@ -13,8 +14,15 @@ import sys
 import tempfile
 import urllib.request
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+if __name__ == "__main__":
+    # Run as a script — make the engine package importable
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from engine.config import json_loads
+
 logger = logging.getLogger(__name__)
 
 # GitHub repo for update checks
@@ -25,45 +33,57 @@ RELEASES_URL = f"https://api.github.com/repos/{GITHUB_OWNER}/{GITHUB_REPO}/relea
 # Where Kiyomi lives on disk
 INSTALL_DIR = Path.home() / ".kiyomi"
 APP_DIR = INSTALL_DIR / "app"
+BACKUP_DIR = INSTALL_DIR / "app.backup"  # previous app/, swapped out by rename
+REQS_HASH_FILE = INSTALL_DIR / ".reqs.sha256"  # requirements.txt last installed
 VERSION_FILE = Path(__file__).parent / "VERSION"
+# Release metadata is a few KB; refuse anything absurdly larger.
+MAX_RELEASE_JSON = 256 * 1024
+
+
+# Compiled once: is_update_request() runs on every incoming message.
+_UPDATE_RE = re.compile("|".join(f"(?:{p})" for p in [
+    r'\bupdate\s*(yourself|kiyomi)\b',
+    r'\bupgrade\s*(yourself|kiyomi)\b',
+    r'\bcheck\s+for\s+updates?\b',
+    r'\bget\s+latest\s+version\b',
+    r'\bupdate\s+to\s+latest\b',
+    r'\bupgrade\s+to\s+latest\b',
+    r'\bplease\s+update\b',
+    r'\bplease\s+upgrade\b',
+    r'^update$',
+    r'^upgrade$',
+]))
+
+# "update" next to any of these is about the user's stuff, not Kiyomi
+_FALSE_POSITIVE_RE = re.compile("|".join([
+    'calendar', 'spreadsheet', 'document', 'profile', 'status',
+    'schedule', 'appointment', 'meeting', 'reminder', 'task',
+    'file', 'record', 'database', 'contact', 'address',
+]))
+
+_UPDATE_INDICATOR_RE = re.compile("|".join([
+    'update me', 'update us', 'need an update', 'want an update',
+]))
 
 
 def is_update_request(message: str) -> bool:
     """Detect if user is asking to update Kiyomi herself."""
     message_lower = message.lower().strip()
 
-    update_patterns = [
-        r'\bupdate\s*(yourself|kiyomi)\b',
-        r'\bupgrade\s*(yourself|kiyomi)\b',
-        r'\bcheck\s+for\s+updates?\b',
-        r'\bget\s+latest\s+version\b',
-        r'\bupdate\s+to\s+latest\b',
-        r'\bupgrade\s+to\s+latest\b',
-        r'\bplease\s+update\b',
-        r'\bplease\s+upgrade\b',
-        r'^update$',
-        r'^upgrade$',
-    ]
+    # Most messages mention none of these — skip the regexes entirely
+    if 'update' not in message_lower and 'upgrade' not in message_lower \
+            and 'latest' not in message_lower:
+        return False
 
-    for pattern in update_patterns:
-        if re.search(pattern, message_lower):
-            return True
+    if _UPDATE_RE.search(message_lower):
+        return True
 
     # Check for standalone "update" but exclude false positives
     if 'update' in message_lower:
-        false_positives = [
-            'calendar', 'spreadsheet', 'document', 'profile', 'status',
-            'schedule', 'appointment', 'meeting', 'reminder', 'task',
-            'file', 'record', 'database', 'contact', 'address',
-        ]
-        for fp in false_positives:
-            if fp in message_lower:
-                return False
-
-        update_indicators = ['update me', 'update us', 'need an update', 'want an update']
-        for indicator in update_indicators:
-            if indicator in message_lower:
-                return True
+        if _FALSE_POSITIVE_RE.search(message_lower):
+            return False
+        if _UPDATE_INDICATOR_RE.search(message_lower):
+            return True
 
     return False
 
@@ -78,13 +98,16 @@ def get_current_version() -> str:
     return "unknown"
 
 
+_VERSION_RE = re.compile(r"v*(\d+(?:\.\d+)*)")
+
+
+@functools.lru_cache(maxsize=64)
 def _parse_version(version_str: str) -> tuple:
-    """Parse 'x.y.z' into a comparable tuple."""
-    try:
-        parts = version_str.strip().lstrip("v").split(".")
-        return tuple(int(p) for p in parts)
-    except (ValueError, AttributeError):
+    """Parse 'x.y.z' into a comparable tuple ((0, 0, 0) if malformed)."""
+    m = _VERSION_RE.fullmatch(version_str.strip()) if isinstance(version_str, str) else None
+    if not m:
         return (0, 0, 0)
+    return tuple(int(p) for p in m.group(1).split("."))
 
 
 async def check_for_updates() -> dict:
@@ -101,11 +124,15 @@ async def check_for_updates() -> dict:
             headers={"Accept": "application/vnd.github+json", "User-Agent": "Kiyomi-Updater"},
         )
 
-        loop = asyncio.get_running_loop()
-        response_data = await loop.run_in_executor(
-            None, lambda: urllib.request.urlopen(req, timeout=15).read()
-        )
-        release = json.loads(response_data)
+        def _fetch():
+            with urllib.request.urlopen(req, timeout=15) as resp:
+                data = resp.read(MAX_RELEASE_JSON + 1)
+            if len(data) > MAX_RELEASE_JSON:
+                raise ValueError(f"release metadata larger than {MAX_RELEASE_JSON} bytes")
+            return data
+
+        response_data = await asyncio.to_thread(_fetch)
+        release = json_loads(response_data)
 
         latest_tag = release.get("tag_name", "")
         latest_version = latest_tag.lstrip("v")
@@ -147,12 +174,37 @@ async def check_for_updates() -> dict:
         }
 
 
+def _extract_zip(zip_path: str, dest: str):
+    """Extract zip_path into dest, inflating members on a few threads.
+
+    zlib releases the GIL while decompressing, so a bundle of many small
+    files extracts faster in parallel. Directories are created up front so
+    worker threads never race on makedirs.
+    """
+    with zipfile.ZipFile(zip_path, "r") as zf:
+        members = zf.infolist()
+        for info in members:
+            # Same sanitizing ZipFile.extract applies to member names
+            parts = [p for p in info.filename.split("/") if p not in ("", ".", "..")]
+            if not info.is_dir():
+                parts = parts[:-1]
+            if parts:
+                os.makedirs(os.path.join(dest, *parts), exist_ok=True)
+        files = [info for info in members if not info.is_dir()]
+        workers = min(8, os.cpu_count() or 1, len(files)) or 1
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for _ in pool.map(lambda info: zf.extract(info, dest), files):
+                pass
+
+
 async def perform_update() -> dict:
     """Download and install the latest version from GitHub Releases.
 
     Returns:
         Dictionary with keys: success, message, changes
     """
+    zip_path = None
+    tmp_extract = None
     try:
         update_info = await check_for_updates()
 
@@ -177,27 +229,29 @@ async def perform_update() -> dict:
         logger.info(f"Downloading update {new_version} from {download_url}...")
 
         # Download zip to temp file
-        loop = asyncio.get_running_loop()
-
         def _download():
             req = urllib.request.Request(
                 download_url,
                 headers={"User-Agent": "Kiyomi-Updater"},
             )
-            tmp = tempfile.NamedTemporaryFile(suffix=".zip", delete=False)
             with urllib.request.urlopen(req, timeout=120) as resp:
-                shutil.copyfileobj(resp, tmp)
-            tmp.close()
+                tmp = tempfile.NamedTemporaryFile(suffix=".zip", delete=False)
+                try:
+                    with tmp:
+                        shutil.copyfileobj(resp, tmp)
+                except BaseException:
+                    os.unlink(tmp.name)
+                    raise
             return tmp.name
 
-        zip_path = await loop.run_in_executor(None, _download)
+        zip_path = await asyncio.to_thread(_download)
 
         logger.info(f"Downloaded to {zip_path}, extracting...")
 
-        # Extract to temp dir first
-        tmp_extract = tempfile.mkdtemp(prefix="kiyomi-update-")
-        with zipfile.ZipFile(zip_path, "r") as zf:
-            zf.extractall(tmp_extract)
+        # Extract to a temp dir next to APP_DIR, so it can be renamed into place
+        INSTALL_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_extract = tempfile.mkdtemp(prefix=".kiyomi-update-", dir=INSTALL_DIR)
+        await asyncio.to_thread(_extract_zip, zip_path, tmp_extract)
 
         # Find the app directory inside the zip (may be nested)
         extracted_items = os.listdir(tmp_extract)
@@ -205,17 +259,13 @@ async def perform_update() -> dict:
         if len(extracted_items) == 1 and (source_dir / extracted_items[0]).is_dir():
             source_dir = source_dir / extracted_items[0]
 
-        # Backup current app
-        backup_dir = INSTALL_DIR / "app.backup"
-        if backup_dir.exists():
-            shutil.rmtree(backup_dir)
-        if APP_DIR.exists():
-            shutil.copytree(APP_DIR, backup_dir)
-
-        # Replace app files
+        # Move the current app aside as the backup, then move the new one in.
+        # Both are renames on the same filesystem, so no tree is copied.
+        if BACKUP_DIR.exists():
+            shutil.rmtree(BACKUP_DIR)
         if APP_DIR.exists():
-            shutil.rmtree(APP_DIR)
-        shutil.copytree(source_dir, APP_DIR)
+            os.rename(APP_DIR, BACKUP_DIR)
+        os.rename(source_dir, APP_DIR)
 
         # Clean up
         os.unlink(zip_path)
@@ -224,16 +274,33 @@ async def perform_update() -> dict:
         # Check if requirements changed
         new_req = APP_DIR / "requirements.txt"
         if new_req.exists():
+            req_hash = hashlib.sha256(new_req.read_bytes()).hexdigest()
             try:
-                import subprocess
-                subprocess.run(
-                    [sys.executable, "-m", "pip", "install", "-q", "-r", str(new_req)],
-                    capture_output=True,
-                    timeout=120,
-                )
-                logger.info("Dependencies updated")
-            except Exception as e:
-                logger.warning(f"Dependency update failed (non-fatal): {e}")
+                last_hash = REQS_HASH_FILE.read_text().strip()
+            except OSError:
+                last_hash = ""
+            if req_hash == last_hash:
+                logger.info("Dependencies unchanged, skipping pip")
+            else:
+                try:
+                    import subprocess
+                    result = subprocess.run(
+                        [sys.executable, "-m", "pip", "install", "-q", "-r", str(new_req)],
+                        capture_output=True,
+                        timeout=120,
+                    )
+                    if result.returncode == 0:
+                        # Only remember a hash pip actually installed, so a
+                        # failed install is retried on the next update
+                        REQS_HASH_FILE.write_text(req_hash)
+                        logger.info("Dependencies updated")
+                    else:
+                        logger.warning(
+                            f"Dependency update failed (non-fatal): pip exited with "
+                            f"code {result.returncode}"
+                        )
+                except Exception as e:
+                    logger.warning(f"Dependency update failed (non-fatal): {e}")
 
         logger.info(f"Update complete: {current_version} -> {new_version}")
 
@@ -245,14 +312,20 @@ async def perform_update() -> dict:
 
     except Exception as e:
         logger.error(f"Update failed: {e}")
-        # Try to restore backup
-        backup_dir = INSTALL_DIR / "app.backup"
-        if backup_dir.exists() and not APP_DIR.exists():
+        # If we failed between the two renames, put the old app back
+        if BACKUP_DIR.exists() and not APP_DIR.exists():
             try:
-                shutil.copytree(backup_dir, APP_DIR)
+                os.rename(BACKUP_DIR, APP_DIR)
                 logger.info("Restored from backup after failed update")
             except Exception:
                 pass
+        if zip_path:
+            try:
+                os.unlink(zip_path)
+            except OSError:
+                pass
+        if tmp_extract:
+            shutil.rmtree(tmp_extract, ignore_errors=True)
         return {
             "success": False,
             "message": f"Update failed: {str(e)}",
@@ -265,9 +338,10 @@ async def restart_bot():
     try:
         logger.info("Restarting bot process...")
         executable = sys.executable
-        args = sys.argv.copy()
-        if args and not args[0].endswith(('python', 'python3', 'Kiyomi')):
-            args.insert(0, executable)
+        args = sys.argv
+        # Scripts need the interpreter prepended; a bundled Kiyomi binary doesn't
+        if args and os.path.basename(args[0]) not in ('python', 'python3', 'Kiyomi'):
+            args = [executable, *args]
         logger.info(f"Restarting with: {executable} {args}")
         os.execv(executable, args)
     except Exception as e: